@@ -50,8 +50,8 @@ def scatterplot_junctions_and_branches(branch_measurements: List[BranchMeasureme
     b = fit[1]
 
     # Plot line
-    xs = [i for i in range(int(min(junction_counts)), int(max(junction_counts)))]
-    ys = [a * x + b for x in xs]
+    xs = np.arange(int(min(junction_counts)), int(max(junction_counts)))
+    ys = a * xs + b
     plt.plot(xs, ys, color='red')
 
     save_path = '../../resources/output/branch-analysis/' + file_name + ".png"
@@ -0,0 +1,322 @@
+"""
+Module for packing a folder of csv files into a single compressed columnar archive (and back).
+
+Every csv file in the folder becomes one image in the archive, identified by its file name without the `.csv`
+extension. Images with the same header share a schema, whose header is stored once. Each column of an image is stored
+as its own compressed, typed array and an index holds the schema and row count of every image, so a single image can
+be read without decompressing the columns of any other image. Columns that hold the same value in every row of an
+image (e.g. the `V1 z`/`V2 z` columns of branch info files) are stored as a single value.
+
+The archive keeps the values of the csv files, not their text: `15.10` is unpacked as `15.1`.
+"""
+import csv
+import os
+from argparse import Namespace, ArgumentParser
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+IMAGES_KEY = '__images__'
+SCHEMAS_KEY = '__schemas__'
+ROWS_KEY = '__rows__'
+IMAGE_ID_COLUMN = 'Image ID'
+
+
+class _ArchiveIndex:
+    """
+    Index of an opened archive: the headers of all schemas and the location of every image.
+    """
+
+    def __init__(self, archive):
+        self.image_ids = archive[IMAGES_KEY].tolist()
+        self.schemas = archive[SCHEMAS_KEY]
+        self.rows = archive[ROWS_KEY]
+        self.headers = [archive[_schema_key(schema, 'header')].tolist()
+                        for schema in range(int(self.schemas.max()) + 1 if len(self.schemas) > 0 else 0)]
+        self.positions = {image_id: position for position, image_id in enumerate(self.image_ids)}
+
+    def position(self, image_id: str) -> int:
+        """
+        Get the position of an image in the index.
+
+        :param image_id: Id of the image
+        :return: The position
+        """
+        if image_id not in self.positions:
+            raise KeyError(f'Image {image_id} not found in archive')
+        return self.positions[image_id]
+
+
+def _schema_key(schema: int, name: str) -> str:
+    """
+    Get the key of an array belonging to a schema in the archive.
+
+    :param schema: Index of the schema
+    :param name: Name of the array
+    :return: The key
+    """
+    return f'schema{schema}/{name}'
+
+
+def _column_key(position: int, column: int) -> str:
+    """
+    Get the key of a column of an image in the archive.
+
+    :param position: Position of the image in the index
+    :param column: Index of the column
+    :return: The key
+    """
+    return f'image{position}/col{column}'
+
+
+def _concatenate_columns(columns: List[np.ndarray]) -> np.ndarray:
+    """
+    Concatenate columns, falling back to strings if their types can not be combined.
+
+    :param columns: The columns
+    :return: The concatenated column
+    """
+    try:
+        return np.concatenate(columns)
+    except (TypeError, ValueError):
+        return np.concatenate([column.astype(str) for column in columns])
+
+
+def _parse_column(values: List[str]) -> np.ndarray:
+    """
+    Convert a column of csv values to the smallest array type that holds them without loss.
+
+    :param values: Column values as strings
+    :return: Typed array of the values
+    """
+    try:
+        column = np.array([int(value) for value in values], dtype=np.int64)
+        if len(column) > 0:
+            return column.astype(np.result_type(np.min_scalar_type(column.min()), np.min_scalar_type(column.max())))
+        return column
+    except ValueError:
+        pass
+    try:
+        return np.array([float(value) for value in values], dtype=np.float64)
+    except ValueError:
+        return np.array(values, dtype=str)
+
+
+def read_csv_columns(file_path: str) -> Tuple[List[str], List[np.ndarray]]:
+    """
+    Read a csv file as typed columns.
+
+    :param file_path: Path to the csv file
+    :return: The header and the list of columns
+    """
+    with open(file_path, newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader, [])
+        rows = [row for row in reader if row]
+
+    columns = [list(values) for values in zip(*rows)] if rows else [[] for _ in header]
+    return header, [_parse_column(values) for values in columns]
+
+
+def export_archive(input_folder: str, archive_path: str) -> List[str]:
+    """
+    Pack all csv files in a folder into a single compressed archive.
+
+    :param input_folder: Path to the folder containing the csv files
+    :param archive_path: Path to the archive file (.npz)
+    :return: The ids of the images that were packed
+    """
+    file_names = sorted(name for name in os.listdir(input_folder) if name.endswith('.csv'))
+
+    arrays: Dict[str, np.ndarray] = {}
+    headers: List[List[str]] = []
+    image_ids, schemas, rows = [], [], []
+    for position, file_name in enumerate(file_names):
+        header, columns = read_csv_columns(os.path.join(input_folder, file_name))
+        if header not in headers:
+            headers.append(header)
+            arrays[_schema_key(len(headers) - 1, 'header')] = np.array(header, dtype=str)
+
+        image_ids.append(file_name[:-len('.csv')])
+        schemas.append(headers.index(header))
+        rows.append(len(columns[0]) if columns else 0)
+        for i, column in enumerate(columns):
+            # Constant columns are stored as a single value and broadcast again when reading
+            if len(column) > 0 and np.all(column == column[0]):
+                column = column[:1].reshape(())
+            arrays[_column_key(position, i)] = column
+
+    arrays[IMAGES_KEY] = np.array(image_ids, dtype=str)
+    arrays[SCHEMAS_KEY] = np.array(schemas, dtype=np.int64)
+    arrays[ROWS_KEY] = np.array(rows, dtype=np.int64)
+    np.savez_compressed(archive_path, **arrays)
+    return image_ids
+
+
+def _read_image(archive, index: _ArchiveIndex, image_id: str) -> Tuple[List[str], List[np.ndarray]]:
+    """
+    Read the columns of a single image from an opened archive.
+
+    :param archive: The opened archive
+    :param index: Index of the archive
+    :param image_id: Id of the image
+    :return: The header and the list of columns
+    """
+    position = index.position(image_id)
+    header = index.headers[int(index.schemas[position])]
+    row_count = int(index.rows[position])
+
+    columns = []
+    for i in range(len(header)):
+        column = archive[_column_key(position, i)]
+        columns.append(np.full(row_count, column, dtype=column.dtype) if column.ndim == 0 else column)
+    return header, columns
+
+
+def _columns_to_rows(columns: List[np.ndarray]) -> List[list]:
+    """
+    Convert columns to rows, like a csv reader would return them (without the header row).
+
+    :param columns: The columns
+    :return: The rows
+    """
+    return [list(row) for row in zip(*[column.tolist() for column in columns])]
+
+
+def list_archive_images(archive_path: str) -> List[str]:
+    """
+    List the ids of all images in an archive.
+
+    :param archive_path: Path to the archive file
+    :return: The image ids
+    """
+    with np.load(archive_path) as archive:
+        return archive[IMAGES_KEY].tolist()
+
+
+def list_archive_headers(archive_path: str) -> List[List[str]]:
+    """
+    List the distinct headers of the images in an archive.
+
+    :param archive_path: Path to the archive file
+    :return: The headers
+    """
+    with np.load(archive_path) as archive:
+        return _ArchiveIndex(archive).headers
+
+
+def read_archive_image(archive_path: str, image_id: str) -> Tuple[List[str], List[np.ndarray]]:
+    """
+    Read the columns of a single image from an archive, only the columns of that image are decompressed.
+
+    :param archive_path: Path to the archive file
+    :param image_id: Id of the image (csv file name without extension)
+    :return: The header and the list of columns
+    """
+    with np.load(archive_path) as archive:
+        return _read_image(archive, _ArchiveIndex(archive), image_id)
+
+
+def read_archive_rows(archive_path: str, image_id: str) -> List[list]:
+    """
+    Read the rows of a single image from an archive, like a csv reader would (without the header row).
+
+    :param archive_path: Path to the archive file
+    :param image_id: Id of the image (csv file name without extension)
+    :return: The rows of the image
+    """
+    _, columns = read_archive_image(archive_path, image_id)
+    return _columns_to_rows(columns)
+
+
+def read_archive_table(archive_path: str, image_ids: Optional[List[str]] = None,
+                       header: Optional[List[str]] = None) -> Tuple[List[str], List[np.ndarray]]:
+    """
+    Read multiple images from an archive as one table, with an image id as first column.
+    All selected images must share the same header.
+
+    :param archive_path: Path to the archive file
+    :param image_ids: Ids of images to read, if None all images with the given header are read
+    :param header: Header of the images to read if no image ids are given, the header of the first image if None
+    :return: The header and the list of columns
+    """
+    with np.load(archive_path) as archive:
+        index = _ArchiveIndex(archive)
+        if image_ids is None:
+            if header is None:
+                header = index.headers[0] if index.headers else []
+            image_ids = [image_id for position, image_id in enumerate(index.image_ids)
+                         if index.headers[index.schemas[position]] == header]
+
+        table_header = None
+        image_columns = []
+        id_columns = []
+        for image_id in image_ids:
+            image_header, columns = _read_image(archive, index, image_id)
+            if table_header is None:
+                table_header = image_header
+            elif image_header != table_header:
+                raise ValueError(f'Header of image {image_id} does not match header of image {image_ids[0]}')
+            image_columns.append(columns)
+            id_columns.append(np.full(len(columns[0]) if columns else 0, image_id))
+
+    if table_header is None:
+        return [IMAGE_ID_COLUMN], [np.array([], dtype=str)]
+
+    columns = [_concatenate_columns([columns[i] for columns in image_columns]) for i in range(len(table_header))]
+    return [IMAGE_ID_COLUMN] + table_header, [np.concatenate(id_columns)] + columns
+
+
+def import_archive(archive_path: str, output_folder: str) -> List[str]:
+    """
+    Unpack an archive into a folder of csv files (one per image).
+
+    :param archive_path: Path to the archive file
+    :param output_folder: Path to the folder the csv files will be written to
+    :return: The paths of the written csv files
+    """
+    os.makedirs(output_folder, exist_ok=True)
+
+    paths = []
+    with np.load(archive_path) as archive:
+        index = _ArchiveIndex(archive)
+        for image_id in index.image_ids:
+            header, columns = _read_image(archive, index, image_id)
+            path = os.path.join(output_folder, image_id + '.csv')
+            with open(path, 'w', newline='') as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(header)
+                writer.writerows(_columns_to_rows(columns))
+            paths.append(path)
+    return paths
+
+
+def get_args() -> Namespace:
+    """
+    Get arguments from CLI contained in a namespace.
+
+    args:
+    1. mode: 'export' (csv folder to archive) or 'import' (archive to csv folder)
+    2. folder: path to the folder containing (or receiving) the csv files
+    3. archive_path: path to the archive file
+
+    :return: Namespace containing CLI arguments
+    """
+    parser = ArgumentParser()
+    parser.add_argument('--mode', type=str, default='export')
+    parser.add_argument('--folder', type=str, default='../resources/data/branch-data')
+    parser.add_argument('--archive_path', type=str, default='../resources/data/branch-data.npz')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+
+    if args.mode == 'export':
+        packed = export_archive(args.folder, args.archive_path)
+        print(f'packed {len(packed)} files into {args.archive_path}')
+    elif args.mode == 'import':
+        unpacked = import_archive(args.archive_path, args.folder)
+        print(f'unpacked {len(unpacked)} files into {args.folder}')
+    else:
+        print(f'Unsupported mode: {args.mode}')
@@ -0,0 +1,298 @@
+"""
+Module for batch analytics of branch measurements across all images.
+
+All branch measurement files are loaded into one table (one row per skeleton) and per-image statistics are computed
+for all images at once from grouped moments. Cohort statistics are combined from the per-image moments, so the raw
+rows are only scanned once.
+"""
+import csv
+import os
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from archive import read_csv_columns, read_archive_table, list_archive_images
+from branch_measurement import BRANCH_MEASUREMENT_FIELDS
+from visualization import generate_density_branch_count_plot
+
+# Skeleton size in voxels is the sum of these fields
+SKELETON_SIZE_FIELDS = ['end_point_voxel_count', 'junction_voxel_count', 'slab_voxel_count']
+COHORT_LABEL = 'Cohort'
+
+
+class BranchTable:
+    """
+    Class to represent the branch measurements of multiple images as one table.
+    """
+
+    def __init__(self, image_names: List[str], image_index: np.ndarray, values: np.ndarray):
+        self.image_names = image_names  # Name of each image, e.g. 532_OR_40_index0.png
+        self.image_index = image_index  # Index (in image_names) of the image of each row
+        self.values = values  # One row per skeleton, one column per field in BRANCH_MEASUREMENT_FIELDS
+
+    def column(self, field: str) -> np.ndarray:
+        """
+        Get all values of a field.
+
+        :param field: Name of the field
+        :return: The values of the field
+        """
+        return self.values[:, BRANCH_MEASUREMENT_FIELDS.index(field)]
+
+    def skeleton_sizes(self) -> np.ndarray:
+        """
+        Get the size (in voxels) of each skeleton.
+
+        :return: The skeleton sizes
+        """
+        return sum(self.column(field) for field in SKELETON_SIZE_FIELDS).astype(np.float64)
+
+
+def _is_branch_data_file(file_name: str) -> bool:
+    """
+    Check whether a file in the branch data folder contains branch measurements (and not branch info).
+
+    :param file_name: Name of the file
+    :return: True if the file contains branch measurements
+    """
+    return 'branch-info' not in file_name
+
+
+def _build_table(image_names: List[str], columns_per_image: List[List[np.ndarray]]) -> BranchTable:
+    """
+    Combine the columns of several images into a table.
+
+    :param image_names: Names of the images
+    :param columns_per_image: Columns (id column first) of each image
+    :return: The table
+    """
+    row_counts = [len(columns[0]) for columns in columns_per_image]
+    image_index = np.repeat(np.arange(len(image_names)), row_counts)
+    values = np.concatenate([np.column_stack(columns[1:]).astype(np.float64) for columns in columns_per_image])
+    return BranchTable(image_names, image_index, values)
+
+
+def load_branch_table(folder_path: str) -> BranchTable:
+    """
+    Load all branch measurement files in a folder into one table.
+
+    :param folder_path: Path to the branch data folder
+    :return: The table
+    """
+    file_names = sorted(name for name in os.listdir(folder_path)
+                        if name.endswith('.csv') and _is_branch_data_file(name))
+    columns_per_image = [read_csv_columns(os.path.join(folder_path, name))[1] for name in file_names]
+    return _build_table([name[:-len('.csv')] for name in file_names], columns_per_image)
+
+
+def load_branch_table_from_archive(archive_path: str) -> BranchTable:
+    """
+    Load all branch measurements in an archive of the branch data folder into one table.
+
+    :param archive_path: Path to the archive file
+    :return: The table
+    """
+    image_names = [image_id for image_id in list_archive_images(archive_path) if _is_branch_data_file(image_id)]
+    _, columns = read_archive_table(archive_path, image_names)
+    present_names, inverse = np.unique(columns[0], return_inverse=True)
+    positions = {name: position for position, name in enumerate(image_names)}
+    image_index = np.array([positions[name] for name in present_names.tolist()], dtype=np.int64)[inverse]
+    values = np.column_stack(columns[2:]).astype(np.float64)
+    return BranchTable(image_names, image_index, values)
+
+
+def load_density_metrics(file_path: str, image_names: List[str]) -> Tuple[List[str], np.ndarray]:
+    """
+    Load the density metrics (output.csv) of the given images.
+
+    :param file_path: Path to the density metrics csv file
+    :param image_names: Names of the images, in the order the metrics should be returned in
+    :return: The metric names and the metrics (one row per image, nan for images without metrics)
+    """
+    header, columns = read_csv_columns(file_path)
+    labels = [re.split(r'[\\/]', label)[-1] for label in columns[1].tolist()]
+    metric_indices = [i for i in range(2, len(header)) if np.issubdtype(columns[i].dtype, np.number)]
+
+    metrics = np.full((len(image_names), len(metric_indices)), np.nan)
+    for row, label in enumerate(labels):
+        if label in image_names:
+            metrics[image_names.index(label)] = [columns[i][row] for i in metric_indices]
+    return [header[i] for i in metric_indices], metrics
+
+
+def grouped_moments(values: np.ndarray, groups: np.ndarray, group_count: int,
+                    weights: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute (weighted) sums, means and covariances of all columns for all groups at once.
+
+    :param values: The values (one row per observation)
+    :param groups: Group index of each row
+    :param group_count: Amount of groups
+    :param weights: Weight of each row, all rows have weight 1 if None
+    :return: The weight sums (groups), sums and means (groups x columns) and covariances (groups x columns x columns)
+    """
+    if weights is None:
+        weights = np.ones(len(values))
+    column_count = values.shape[1]
+
+    weight_sums = np.bincount(groups, weights=weights, minlength=group_count)
+    sums = np.zeros((group_count, column_count))
+    products = np.zeros((group_count, column_count, column_count))
+    for i in range(column_count):
+        sums[:, i] = np.bincount(groups, weights=weights * values[:, i], minlength=group_count)
+        for j in range(i, column_count):
+            products[:, i, j] = np.bincount(groups, weights=weights * values[:, i] * values[:, j],
+                                            minlength=group_count)
+            products[:, j, i] = products[:, i, j]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums / weight_sums[:, None]
+        covariances = products / weight_sums[:, None, None] - means[:, :, None] * means[:, None, :]
+    return weight_sums, sums, means, covariances
+
+
+def combine_moments(weight_sums: np.ndarray, means: np.ndarray,
+                    covariances: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Combine the moments of several groups into the moments of all groups together (as a single group).
+
+    :param weight_sums: Weight sums of the groups
+    :param means: Means of the groups
+    :param covariances: Covariances of the groups
+    :return: The weight sum, means and covariances of the combined group (with a group axis of length 1)
+    """
+    present = weight_sums > 0
+    weight_sums, means, covariances = weight_sums[present], means[present], covariances[present]
+
+    total = weight_sums.sum()
+    mean = (weight_sums[:, None] * means).sum(axis=0) / total
+    second_moments = covariances + means[:, :, None] * means[:, None, :]
+    covariance = (weight_sums[:, None, None] * second_moments).sum(axis=0) / total - np.outer(mean, mean)
+    return np.array([total]), mean[None, :], covariance[None, :, :]
+
+
+def linear_regressions(means: np.ndarray, covariances: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute least squares fits y = a * x + b and correlations between all pairs of columns, for all groups at once.
+
+    :param means: Means of the groups (groups x columns)
+    :param covariances: Covariances of the groups (groups x columns x columns)
+    :return: The slopes a, intercepts b and correlations, indexed as [group, x column, y column]
+    """
+    variances = np.diagonal(covariances, axis1=1, axis2=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = covariances / variances[:, :, None]
+        intercepts = means[:, None, :] - slopes * means[:, :, None]
+        correlations = covariances / np.sqrt(variances[:, :, None] * variances[:, None, :])
+    return slopes, intercepts, correlations
+
+
+def compute_image_features(table: BranchTable) -> Tuple[List[str], np.ndarray]:
+    """
+    Compute per-image features of the branch measurements: totals, means and skeleton size weighted means.
+
+    :param table: The branch table
+    :return: The feature names and features (one row per image)
+    """
+    image_count = len(table.image_names)
+    counts, totals, means, _ = grouped_moments(table.values, table.image_index, image_count)
+    _, _, weighted_means, _ = grouped_moments(table.values, table.image_index, image_count, table.skeleton_sizes())
+
+    names = (['skeleton_count'] + [f'total {field}' for field in BRANCH_MEASUREMENT_FIELDS]
+             + [f'mean {field}' for field in BRANCH_MEASUREMENT_FIELDS]
+             + [f'weighted mean {field}' for field in BRANCH_MEASUREMENT_FIELDS])
+    features = np.column_stack([counts, totals, means, weighted_means])
+    return names, features
+
+
+def compute_branch_regressions(table: BranchTable, weighted: bool) -> Tuple[List[str], np.ndarray, np.ndarray,
+                                                                            np.ndarray]:
+    """
+    Compute regressions and correlations between all pairs of branch measurement fields, per image and for the cohort.
+
+    :param table: The branch table
+    :param weighted: Whether to weigh skeletons by their size
+    :return: The group labels (images and cohort last), slopes, intercepts and correlations,
+             indexed as [group, x field, y field]
+    """
+    weights = table.skeleton_sizes() if weighted else None
+    weight_sums, _, image_means, image_covariances = grouped_moments(table.values, table.image_index,
+                                                                     len(table.image_names), weights)
+    _, cohort_means, cohort_covariances = combine_moments(weight_sums, image_means, image_covariances)
+
+    means = np.concatenate([image_means, cohort_means])
+    covariances = np.concatenate([image_covariances, cohort_covariances])
+    slopes, intercepts, correlations = linear_regressions(means, covariances)
+    return table.image_names + [COHORT_LABEL], slopes, intercepts, correlations
+
+
+def compute_density_regressions(features: np.ndarray, metrics: np.ndarray) -> Tuple[np.ndarray, np.ndarray,
+                                                                                   np.ndarray]:
+    """
+    Compute regressions and correlations of density metrics on image features across the cohort.
+
+    :param features: Image features (one row per image)
+    :param metrics: Density metrics (one row per image)
+    :return: The slopes, intercepts and correlations, indexed as [feature, metric]
+    """
+    # Images without density metrics are left out
+    present = ~np.isnan(metrics).any(axis=1)
+    values = np.column_stack([features, metrics])[present]
+    _, _, means, covariances = grouped_moments(values, np.zeros(len(values), dtype=np.int64), 1)
+    slopes, intercepts, correlations = linear_regressions(means, covariances)
+
+    feature_count = features.shape[1]
+    return (slopes[0, :feature_count, feature_count:], intercepts[0, :feature_count, feature_count:],
+            correlations[0, :feature_count, feature_count:])
+
+
+def write_csv(path: str, header: List[str], rows: List[list]) -> None:
+    """
+    Write rows to a csv file.
+
+    :param path: Path to the csv file
+    :param header: The header row
+    :param rows: The rows
+    """
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(header)
+        writer.writerows(rows)
+    print(f'saved table to {path}')
+
+
+if __name__ == '__main__':
+    output_folder = '../../resources/output/branch-analysis'
+    archive_path = '../../resources/data/branch-data.npz'
+    if os.path.exists(archive_path):
+        branch_table = load_branch_table_from_archive(archive_path)
+    else:
+        branch_table = load_branch_table('../../resources/data/branch-data')
+    image_names = branch_table.image_names
+
+    feature_names, image_features = compute_image_features(branch_table)
+    write_csv(output_folder + '/image-statistics.csv', ['image'] + feature_names,
+              [[name] + row.tolist() for name, row in zip(image_names, image_features)])
+
+    regression_rows = []
+    for is_weighted in [False, True]:
+        labels, slopes, intercepts, correlations = compute_branch_regressions(branch_table, is_weighted)
+        for g, label in enumerate(labels):
+            for x, x_field in enumerate(BRANCH_MEASUREMENT_FIELDS):
+                for y, y_field in enumerate(BRANCH_MEASUREMENT_FIELDS):
+                    if x != y:
+                        regression_rows.append([label, is_weighted, x_field, y_field, slopes[g, x, y],
+                                                intercepts[g, x, y], correlations[g, x, y]])
+    write_csv(output_folder + '/branch-regressions.csv',
+              ['image', 'skeleton size weighted', 'x', 'y', 'slope', 'intercept', 'correlation'], regression_rows)
+
+    metric_names, density_metrics = load_density_metrics('../../resources/data/output.csv', image_names)
+    slopes, intercepts, correlations = compute_density_regressions(image_features, density_metrics)
+    write_csv(output_folder + '/density-regressions.csv', ['x', 'y', 'slope', 'intercept', 'correlation'],
+              [[feature, metric, slopes[f, m], intercepts[f, m], correlations[f, m]]
+               for f, feature in enumerate(feature_names) for m, metric in enumerate(metric_names)])
+
+    generate_density_branch_count_plot(density_metrics[:, metric_names.index('Area Percentage')].tolist(),
+                                       image_features[:, feature_names.index('total branch_count')].tolist(),
+                                       output_folder, 'density-branch-count')
@@ -4,6 +4,11 @@ Module relating to vascular branch measurements
 from typing import List
 from measurement import Measurement
 
+# Names of the measured fields, in the order of the csv columns (after the id column)
+BRANCH_MEASUREMENT_FIELDS = ['branch_count', 'junction_count', 'end_point_voxel_count', 'junction_voxel_count',
+                             'slab_voxel_count', 'avg_branch_length', 'triple_point_count', 'quadruple_point_count',
+                             'max_branch_length']
+
 
 class BranchMeasurement(Measurement):
     """
@@ -7,6 +7,7 @@ from typing import IO, List
 
 from matplotlib import pyplot as plt
 
+from archive import read_archive_rows
 from diameter_measurement import DiameterMeasurement, read_diameter_measurement_row
 from branch_measurement import BranchMeasurement, read_branch_measurements_from_row
 
@@ -65,6 +66,28 @@ def read_branch_measurements(file_path: str) -> List[BranchMeasurement]:
     return [read_branch_measurements_from_row(row) for row in reader]
 
 
+def read_diameter_measurements_from_archive(archive_path: str, image_id: str) -> List[DiameterMeasurement]:
+    """
+    Read diameter measurements of a single image from an archive, without decompressing the other images.
+
+    :param archive_path: Path to the archive file.
+    :param image_id: Id of the image (csv file name without extension)
+    :return: List containing the diameter measurements
+    """
+    return [read_diameter_measurement_row(row) for row in read_archive_rows(archive_path, image_id)]
+
+
+def read_branch_measurements_from_archive(archive_path: str, image_id: str) -> List[BranchMeasurement]:
+    """
+    Read branch measurements of a single image from an archive, without decompressing the other images.
+
+    :param archive_path: Path to the archive file.
+    :param image_id: Id of the image (csv file name without extension)
+    :return: List containing the branch measurements
+    """
+    return [read_branch_measurements_from_row(row) for row in read_archive_rows(archive_path, image_id)]
+
+
 def save_figure(path: str) -> None:
     """
     Save a figure to a file.
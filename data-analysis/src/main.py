@@ -1,9 +1,15 @@
 """
 Main module, get analysis results from data input.
 """
+import os
 from argparse import Namespace, ArgumentParser
 from file_utils import read_diameter_measurements, extract_file_name
-from visualization import generate_analysis_visualization
+from diameter_measurement import DiameterMeasurement
+from sketches import DiameterSketch, load_sketch, DEFAULT_BIN_COUNT, DEFAULT_QUANTILE_K
+from visualization import generate_analysis_visualization, generate_cohort_visualization, build_diameter_sketch, \
+    sketch_max_value, COHORT_OUTPUT_SUFFIXES, MAX_DIAMETER
+
+MERGED_DATA_FILE = 'merged_data.csv'  # Output of merge.sh, holds the measurements of all other files in the folder
 
 
 def get_args() -> Namespace:
@@ -11,7 +17,7 @@ def get_args() -> Namespace:
     Get arguments from CLI contained in a namespace.
 
     args:
-    1. file_path: path to csv file containing data.
+    1. file_path: path to csv file containing data (or to a folder of csv files for a cohort graph).
     2. output_type: type of output of the analysis
     3. output_folder: path to folder where the analysis output should be daved
     4. pixel_measurements: whether you want your results to be measured in pixels (True) or microns (False)
@@ -40,10 +46,67 @@ def generate_graph_for_csv(file_path: str, output_type: str, output_folder: str,
     generate_analysis_visualization(diameter_measurements, output_type, output_folder, file_name, pixel_measurements)
 
 
+def load_or_build_sketch(file_path: str, sketch_folder: str, pixel_measurements: bool) -> DiameterSketch:
+    """
+    Load the sketch of a csv file from the sketch folder, or build it from the csv file (and save it) if there is no
+    sketch yet, the csv file changed since the sketch was saved or the sketch was built with other parameters.
+    MAX_DIAMETER and PIXEL_SIZE are part of the sketch file name, since they change which measurements are sketched.
+
+    :param file_path: Path to the csv file
+    :param sketch_folder: Path to the folder where sketches are saved
+    :param pixel_measurements: whether you want your results to be measured in pixels (True) or microns (False)
+    :return: The sketch
+    """
+    unit = 'pixels' if pixel_measurements else 'microns'
+    parameters = f'max{MAX_DIAMETER}-pixel{DiameterMeasurement.PIXEL_SIZE}'
+    sketch_path = os.path.join(sketch_folder, f'{extract_file_name(file_path)}-{unit}-{parameters}-sketch.npz')
+    if os.path.exists(sketch_path) and os.path.getmtime(sketch_path) >= os.path.getmtime(file_path):
+        sketch = load_sketch(sketch_path)
+        if (sketch.max_value == sketch_max_value(pixel_measurements) and sketch.bin_count == DEFAULT_BIN_COUNT
+                and sketch.quantile_sketch.k == DEFAULT_QUANTILE_K):
+            return sketch
+
+    sketch = build_diameter_sketch(read_diameter_measurements(file_path), pixel_measurements)
+    os.makedirs(sketch_folder, exist_ok=True)
+    sketch.save(sketch_path)
+    return sketch
+
+
+def generate_cohort_graph_for_folder(folder_path: str, output_type: str, output_folder: str,
+                                     pixel_measurements: bool) -> None:
+    """
+    For a folder of csv files (one per image), generate a graph of each image and the whole cohort and save it to the
+    output folder. Each image is summarized in a sketch that is saved in the sketches subfolder of the output folder,
+    later runs merge the saved sketches instead of reading the csv files again.
+    The merged data file (see merge.sh) is skipped, since its measurements are already in the other files.
+
+    :param folder_path: Path to the folder
+    :param output_type: Type of output graph
+    :param output_folder: Path to output folder
+    :param pixel_measurements: whether you want your results to be measured in pixels (True) or microns (False)
+    """
+    if output_type not in COHORT_OUTPUT_SUFFIXES:
+        print(f'Unsupported cohort output type: {output_type}')
+        return
+
+    file_names = sorted(name for name in os.listdir(folder_path)
+                        if name.endswith('.csv') and name != MERGED_DATA_FILE)
+    sketch_folder = os.path.join(output_folder, 'sketches')
+    sketches = [load_or_build_sketch(os.path.join(folder_path, name), sketch_folder, pixel_measurements)
+                for name in file_names]
+    labels = [extract_file_name(name) for name in file_names]
+    generate_cohort_visualization(sketches, labels, output_type, output_folder, 'cohort', pixel_measurements)
+
+
 if __name__ == '__main__':
     """
     Entry point of the application.
     """
     args = get_args()
 
-    generate_graph_for_csv(args.file_path, args.output_type, args.output_folder, True if args.pixel_measurements == 'true' else False)
\ No newline at end of file
+    if os.path.isdir(args.file_path):
+        generate_cohort_graph_for_folder(args.file_path, args.output_type, args.output_folder,
+                                         True if args.pixel_measurements == 'true' else False)
+    else:
+        generate_graph_for_csv(args.file_path, args.output_type, args.output_folder,
+                               True if args.pixel_measurements == 'true' else False)
\ No newline at end of file
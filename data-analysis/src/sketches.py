@@ -0,0 +1,310 @@
+"""
+Module for mergeable summaries (sketches) of diameter measurements.
+
+A sketch summarizes the measurements of an image with a fixed-resolution histogram and a KLL quantile sketch, both
+of which take a bounded amount of memory regardless of the amount of measurements. Sketches of several images can be
+merged into a sketch of the whole cohort without going back to the raw measurements.
+"""
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_BIN_COUNT = 1000
+DEFAULT_QUANTILE_K = 200
+DEFAULT_SEED = 0  # Fixed seed, so compaction (and thus the estimated quantiles) is the same on every run
+
+
+class KllSketch:
+    """
+    KLL quantile sketch (Karnin, Lang and Liberty), items in compactor h have weight 2 ** h.
+    """
+
+    def __init__(self, k: int = DEFAULT_QUANTILE_K, seed: Optional[int] = None):
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.compactors: List[np.ndarray] = []
+        self.size = 0
+        self.max_size = 0
+        self._grow()
+
+    @classmethod
+    def from_compactors(cls, k: int, compactors: List[np.ndarray], seed: Optional[int] = None) -> 'KllSketch':
+        """
+        Create a sketch from the compactors of a previously built sketch.
+
+        :param k: Size parameter of the sketch
+        :param compactors: The compactors, lowest first
+        :param seed: Seed of the random compaction
+        :return: The sketch
+        """
+        sketch = cls(k, seed)
+        while len(sketch.compactors) < len(compactors):
+            sketch._grow()
+        sketch.compactors = [np.asarray(compactor, dtype=np.float64) for compactor in compactors]
+        sketch.size = sum(len(compactor) for compactor in sketch.compactors)
+        return sketch
+
+    def _grow(self) -> None:
+        """
+        Add a compactor on top of the existing ones.
+        """
+        self.compactors.append(np.empty(0, dtype=np.float64))
+        self.max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def _capacity(self, h: int) -> int:
+        """
+        Get the capacity of a compactor, lower compactors have less capacity than higher ones.
+
+        :param h: Height of the compactor
+        :return: The capacity
+        """
+        depth = len(self.compactors) - h - 1
+        return int(np.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def _compress(self) -> None:
+        """
+        Compact the lowest full compactor until the sketch fits in its maximum size again.
+        """
+        while self.size >= self.max_size:
+            for h in range(len(self.compactors)):
+                if len(self.compactors[h]) >= self._capacity(h):
+                    if h + 1 >= len(self.compactors):
+                        self._grow()
+                    items = np.sort(self.compactors[h])
+
+                    # With an odd amount of items the smallest one stays behind
+                    remainder = len(items) % 2
+                    promoted = items[remainder + self.rng.integers(2)::2]
+
+                    self.compactors[h] = items[:remainder]
+                    self.compactors[h + 1] = np.concatenate([self.compactors[h + 1], promoted])
+                    break
+            self.size = sum(len(compactor) for compactor in self.compactors)
+
+    def update(self, values: Iterable[float]) -> None:
+        """
+        Add values to the sketch.
+
+        :param values: The values
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.compactors[0] = np.concatenate([self.compactors[0], values])
+        self.size += len(values)
+        self._compress()
+
+    def merge(self, other: 'KllSketch') -> None:
+        """
+        Merge another sketch into this sketch.
+
+        :param other: The other sketch
+        """
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for h, compactor in enumerate(other.compactors):
+            self.compactors[h] = np.concatenate([self.compactors[h], compactor])
+        self.size = sum(len(compactor) for compactor in self.compactors)
+        self._compress()
+
+    def weighted_items(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get all items in the sketch with their weights, sorted by item.
+
+        :return: The items and their weights
+        """
+        items = np.concatenate(self.compactors)
+        weights = np.concatenate([np.full(len(compactor), 2 ** h, dtype=np.int64)
+                                  for h, compactor in enumerate(self.compactors)])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    def quantiles(self, qs: Iterable[float]) -> np.ndarray:
+        """
+        Estimate quantiles of the values added to the sketch.
+
+        :param qs: Quantiles to estimate (between 0 and 1)
+        :return: The estimated quantiles
+        """
+        qs = np.asarray(qs, dtype=np.float64)
+        items, weights = self.weighted_items()
+        if len(items) == 0:
+            return np.full(qs.shape, np.nan)
+
+        cumulative = np.cumsum(weights)
+        ranks = qs * cumulative[-1]
+        indices = np.searchsorted(cumulative, ranks, side='left')
+        return items[np.clip(indices, 0, len(items) - 1)]
+
+
+class DiameterSketch:
+    """
+    Mergeable summary of diameter measurements: fixed-resolution histogram, quantile sketch and moments.
+    """
+
+    def __init__(self, max_value: float, bin_count: int = DEFAULT_BIN_COUNT, k: int = DEFAULT_QUANTILE_K,
+                 seed: Optional[int] = None):
+        self.max_value = max_value
+        self.bin_count = bin_count
+        self.counts = np.zeros(bin_count, dtype=np.int64)
+        self.quantile_sketch = KllSketch(k, seed)
+        self.count = 0
+        self.total = 0.0
+        self.total_squared = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def __repr__(self):
+        """
+        Convert the sketch to a string.
+
+        :return: String representation of the sketch
+        """
+        return f'DiameterSketch(count={self.count}, min={self.min}, max={self.max})'
+
+    @property
+    def bin_width(self) -> float:
+        """
+        Width of the sketch histogram bins.
+        """
+        return self.max_value / self.bin_count
+
+    @property
+    def bin_edges(self) -> np.ndarray:
+        """
+        Edges of the sketch histogram bins.
+        """
+        return np.linspace(0, self.max_value, self.bin_count + 1)
+
+    @property
+    def mean(self) -> float:
+        """
+        Mean of the measurements.
+        """
+        return self.total / self.count if self.count > 0 else np.nan
+
+    @property
+    def std(self) -> float:
+        """
+        Standard deviation of the measurements.
+        """
+        if self.count == 0:
+            return np.nan
+        return float(np.sqrt(max(self.total_squared / self.count - self.mean ** 2, 0)))
+
+    def update(self, values: Iterable[float]) -> None:
+        """
+        Add values to the sketch, values outside of [0, max_value] are counted in the first or last bin.
+
+        :param values: The values
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return
+
+        indices = np.clip((values / self.bin_width).astype(np.int64), 0, self.bin_count - 1)
+        self.counts += np.bincount(indices, minlength=self.bin_count)
+        self.quantile_sketch.update(values)
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.total_squared += float(np.square(values).sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other: 'DiameterSketch') -> None:
+        """
+        Merge another sketch into this sketch, both sketches must have the same histogram resolution.
+
+        :param other: The other sketch
+        """
+        if self.max_value != other.max_value or self.bin_count != other.bin_count:
+            raise ValueError('Cannot merge sketches with different histogram resolutions')
+
+        self.counts += other.counts
+        self.quantile_sketch.merge(other.quantile_sketch)
+        self.count += other.count
+        self.total += other.total
+        self.total_squared += other.total_squared
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantiles(self, qs: Iterable[float]) -> np.ndarray:
+        """
+        Estimate quantiles of the measurements.
+
+        :param qs: Quantiles to estimate (between 0 and 1)
+        :return: The estimated quantiles
+        """
+        return self.quantile_sketch.quantiles(qs)
+
+    def histogram(self, bin_width: Optional[float] = None, density: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get a histogram of the measurements, starting at the minimum measurement.
+        If a bin width is given, the sketch bins are combined into bins of (approximately) that width.
+
+        :param bin_width: Width of the histogram bins, sketch resolution if None
+        :param density: Whether to normalize the histogram to a probability density
+        :return: The histogram values and bin edges
+        """
+        first = int(np.clip(self.min / self.bin_width, 0, self.bin_count - 1)) if self.count > 0 else 0
+        last = int(np.clip(self.max / self.bin_width, 0, self.bin_count - 1)) + 1 if self.count > 0 else 0
+        counts = self.counts[first:last]
+        edges = self.bin_edges[first:last + 1]
+
+        if bin_width is not None and bin_width > self.bin_width and len(counts) > 0:
+            factor = int(round(bin_width / self.bin_width))
+            padding = -len(counts) % factor
+            counts = np.pad(counts, (0, padding)).reshape(-1, factor).sum(axis=1)
+            edges = edges[0] + np.arange(len(counts) + 1) * factor * self.bin_width
+
+        if density:
+            total = counts.sum()
+            return (counts / (total * np.diff(edges)) if total > 0 else counts.astype(np.float64)), edges
+        return counts, edges
+
+    def save(self, path: str) -> None:
+        """
+        Save the sketch to a file (.npz).
+
+        :param path: Path to the file
+        """
+        compactors = {f'compactor{h}': compactor for h, compactor in enumerate(self.quantile_sketch.compactors)}
+        np.savez_compressed(path, counts=self.counts, max_value=self.max_value, k=self.quantile_sketch.k,
+                            moments=np.array([self.count, self.total, self.total_squared, self.min, self.max]),
+                            **compactors)
+
+
+def load_sketch(path: str, seed: Optional[int] = DEFAULT_SEED) -> DiameterSketch:
+    """
+    Load a sketch from a file.
+
+    :param path: Path to the file
+    :param seed: Seed of the random compaction of values added to the loaded sketch
+    :return: The sketch
+    """
+    with np.load(path) as data:
+        k = int(data['k'])
+        sketch = DiameterSketch(float(data['max_value']), len(data['counts']), k, seed)
+        sketch.counts = data['counts'].astype(np.int64)
+        count, sketch.total, sketch.total_squared, sketch.min, sketch.max = data['moments'].tolist()
+        sketch.count = int(count)
+
+        compactor_count = len([key for key in data.files if key.startswith('compactor')])
+        sketch.quantile_sketch = KllSketch.from_compactors(k, [data[f'compactor{h}'] for h in range(compactor_count)],
+                                                           seed)
+    return sketch
+
+
+def merge_sketches(sketches: List[DiameterSketch], seed: Optional[int] = DEFAULT_SEED) -> DiameterSketch:
+    """
+    Merge sketches (e.g. of several images) into a new sketch (e.g. of a cohort).
+
+    :param sketches: The sketches, all with the same histogram resolution
+    :param seed: Seed of the random compaction of the merged sketch
+    :return: The merged sketch
+    """
+    if not sketches:
+        raise ValueError('Cannot merge an empty list of sketches')
+
+    merged = DiameterSketch(sketches[0].max_value, sketches[0].bin_count, sketches[0].quantile_sketch.k, seed)
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
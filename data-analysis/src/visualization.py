@@ -8,8 +8,8 @@ from scipy.optimize import curve_fit
 
 from measurement import Measurement
 from diameter_measurement import DiameterMeasurement, filter_diameter_measurements
-from branch_measurement import BranchMeasurement
 from file_utils import save_figure
+from sketches import DiameterSketch, merge_sketches, DEFAULT_SEED
 import matplotlib.pyplot as plt
 from scipy.stats import poisson
 from scipy.stats import norm, binom
@@ -17,6 +17,8 @@ from scipy.optimize import curve_fit
 
 HISTOGRAM_BIN_WIDTH = np.sqrt(2) + 0.0000001
 MAX_DIAMETER = 100  # in microns
+VIOLIN_SMOOTHING = 0.03  # Width of the violin smoothing kernel, as a fraction of the sketch range
+COHORT_OUTPUT_SUFFIXES = {'histogram': 'hist', 'violinplot': 'violin', 'boxplot': 'box'}  # Supported cohort outputs
 
 
 def generate_analysis_visualization(measurements: List[Measurement], output_type: str, output_folder_path: str,
@@ -36,26 +38,144 @@ def generate_analysis_visualization(measurements: List[Measurement], output_type
         generate_histogram(measurements, output_folder_path, file_name, pixel_measurements)
     elif output_type == 'violinplot':
         generate_violinplot(measurements, output_folder_path, file_name, pixel_measurements)
+    elif output_type == 'boxplot':
+        generate_boxplot(measurements, output_folder_path, file_name, pixel_measurements)
     elif output_type == 'scatterplot':
         generate_scatterplot(measurements, output_folder_path, file_name, pixel_measurements)
-    elif output_type == 'density/branch_count':
-        generate_density_branch_count_plot(measurements, output_folder_path, file_name)
     else:
         print(f'Unsupported output type: {output_type}')
 
 
-def generate_density_branch_count_plot(measurements: List[BranchMeasurement],
-                                       output_folder_path: str, file_name) -> None:
+def generate_cohort_visualization(sketches: List[DiameterSketch], labels: List[str], output_type: str,
+                                  output_folder_path: str, file_name: str, pixel_measurements: bool) -> None:
     """
-    Plot vessel density against average branch count.
+    Generate a visualization of a cohort of images from their sketches, next to a merged sketch of the whole cohort.
+    Histograms are only generated for the merged sketch.
+
+    :param sketches: Sketches of the diameter measurements of each image
+    :param labels: Labels of the images
+    :param output_type: Type of output graph (histogram, violinplot or boxplot)
+    :param output_folder_path: Path to folder where output will be saved
+    :param file_name: Name of the output file
+    :param pixel_measurements: Whether the sketches are measured in pixels (True) or microns (False)
+    """
+    if output_type not in COHORT_OUTPUT_SUFFIXES:
+        print(f'Unsupported cohort output type: {output_type}')
+        return
+
+    cohort_sketch = merge_sketches(sketches)
+    if output_type == 'histogram':
+        save_sketch_histogram(cohort_sketch, output_folder_path, file_name)
+        return
+
+    sketches = sketches + [cohort_sketch]
+    labels = labels + ['Cohort']
+    positions = [i + 1 for i in range(len(sketches))]
+
+    if output_type == 'violinplot':
+        plot_sketch_violins(sketches, positions)
+    else:
+        plot_sketch_boxplots(sketches, positions)
+
+    plt.xticks(positions, labels, rotation=90)
+    plt.ylabel(f'Vessel diameter {"(pixels)" if pixel_measurements else "(microns)"}')
+    plt.title('Vessel Diameters per Image')
+    plt.tight_layout()
+
+    save_path = output_folder_path + f'/{file_name}-{COHORT_OUTPUT_SUFFIXES[output_type]}.png'
+    save_figure(save_path)
+
+
+def sketch_max_value(pixel_measurements: bool) -> float:
+    """
+    Get the maximum value of the histogram of diameter sketches.
+
+    :param pixel_measurements: Whether you want your results to be measured in pixels (True) or microns (False)
+    :return: The maximum value, in pixels or microns
+    """
+    return MAX_DIAMETER / DiameterMeasurement.PIXEL_SIZE if pixel_measurements else MAX_DIAMETER
+
+
+def build_diameter_sketch(measurements: List[DiameterMeasurement], pixel_measurements: bool) -> DiameterSketch:
+    """
+    Summarize diameter measurements in a sketch.
 
     :param measurements: The measurements
+    :param pixel_measurements: Whether you want your results to be measured in pixels (True) or microns (False)
+    :return: The sketch of the filtered measurements
+    """
+    sketch = DiameterSketch(sketch_max_value(pixel_measurements), seed=DEFAULT_SEED)
+    sketch.update(filter_diameter_measurements(measurements, MAX_DIAMETER, pixel_measurements))
+    return sketch
+
+
+def plot_sketch_violins(sketches: List[DiameterSketch], positions: List[float]) -> None:
+    """
+    Draw violins from sketches, the violin shapes come from the smoothed sketch histograms instead of a KDE.
+
+    :param sketches: The sketches
+    :param positions: Positions of the violins on the x-axis
+    """
+    violin_stats = []
+    for sketch in sketches:
+        hist, bin_edges = sketch.histogram(density=True)
+
+        # Smooth the histogram with a gaussian kernel
+        sigma = max(VIOLIN_SMOOTHING * sketch.bin_count, 1)
+        half_width = int(3 * sigma)
+        kernel = np.exp(-0.5 * (np.arange(-half_width, half_width + 1) / sigma) ** 2)
+        hist = np.convolve(np.pad(hist, half_width), kernel / kernel.sum(), mode='same')
+        coords = bin_edges[0] + sketch.bin_width * (np.arange(len(hist)) - half_width + 0.5)
+
+        # Like a KDE violin, only draw the shape between the extrema
+        in_range = (coords >= sketch.min - sketch.bin_width / 2) & (coords <= sketch.max + sketch.bin_width / 2)
+        median = sketch.quantiles([0.5])[0]
+        violin_stats.append({
+            'coords': coords[in_range],
+            'vals': hist[in_range],
+            'mean': sketch.mean,
+            'median': median,
+            'min': sketch.min,
+            'max': sketch.max
+        })
+    plt.gca().violin(violin_stats, positions=positions, showextrema=True, showmedians=True)
+
+
+def plot_sketch_boxplots(sketches: List[DiameterSketch], positions: List[float]) -> None:
+    """
+    Draw box plots from sketches, whiskers extend to 1.5 times the interquartile range (individual outliers are not
+    kept in a sketch and thus not drawn).
+
+    :param sketches: The sketches
+    :param positions: Positions of the boxes on the x-axis
+    """
+    box_stats = []
+    for sketch in sketches:
+        q1, median, q3 = sketch.quantiles([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        box_stats.append({
+            'med': median,
+            'q1': q1,
+            'q3': q3,
+            'whislo': max(sketch.min, q1 - 1.5 * iqr),
+            'whishi': min(sketch.max, q3 + 1.5 * iqr),
+            'mean': sketch.mean,
+            'fliers': []
+        })
+    plt.gca().bxp(box_stats, positions=positions, showmeans=True)
+
+
+def generate_density_branch_count_plot(densities: List[float], branch_counts: List[float],
+                                       output_folder_path: str, file_name: str) -> None:
+    """
+    Plot vessel density against branch count, one point per image.
+
+    :param densities: Vessel density (area percentage) of each image
+    :param branch_counts: Branch count of each image
     :param output_folder_path: The output file path
     :param file_name: The file name
     """
-    densities = [measurement.area_percentage for measurement in measurements]
-    branch_lengths = [measurement.num_branches for measurement in measurements]
-    plt.scatter(densities, branch_lengths, marker='o')
+    plt.scatter(densities, branch_counts, marker='o')
     plt.xlabel('Vessel density (%)')
     plt.ylabel('Branch count')
     plt.title('Vessel Density and Branch Count')
@@ -74,10 +194,20 @@ def generate_histogram(measurements: List[DiameterMeasurement], output_folder_pa
     :param file_name: Name of original image file
     :param pixel_measurements: Whether you want your results to be measured in pixels (True) or microns (False)
     """
-    diameters = filter_diameter_measurements(measurements, MAX_DIAMETER, pixel_measurements)
+    sketch = build_diameter_sketch(measurements, pixel_measurements)
+    save_sketch_histogram(sketch, output_folder_path, file_name)
 
-    bin_width = int(min(diameters))
-    hist, bin_edges = np.histogram(diameters, bins=np.arange(min(diameters), max(diameters) + bin_width, bin_width), density=True)
+
+def save_sketch_histogram(sketch: DiameterSketch, output_folder_path: str, file_name: str) -> None:
+    """
+    Generate a histogram with a gaussian fit from a sketch and save to a file.
+
+    :param sketch: The sketch of the measurements
+    :param output_folder_path: Path to the output folder
+    :param file_name: Name of original image file
+    """
+    bin_width = int(sketch.min)
+    hist, bin_edges = sketch.histogram(bin_width, density=True)
 
     # Calculate bin centers
     bin_centers = 0.5 * (bin_edges[:-1] + bin_edges[1:])
@@ -88,7 +218,7 @@ def generate_histogram(measurements: List[DiameterMeasurement], output_folder_pa
 
     # Fit the normal distribution using curve_fit
     # Initial guess for parameters (you may need to adjust this based on your data)
-    initial_params = [np.mean(diameters), np.std(diameters)]
+    initial_params = [sketch.mean, sketch.std]
 
     # Use curve_fit to find the best-fit parameters
     params, covariance = curve_fit(normal_distribution, bin_centers, hist, p0=initial_params)
@@ -97,7 +227,7 @@ def generate_histogram(measurements: List[DiameterMeasurement], output_folder_pa
     mu_fit, sigma_fit = params
 
     # Generate the fitted normal distribution
-    x_range = [i for i in range(int(min(diameters)) - 1, int(max(diameters)) + 1)]
+    x_range = [i for i in range(int(sketch.min) - 1, int(sketch.max) + 1)]
     fitted_distribution = normal_distribution(x_range, mu_fit, sigma_fit)
 
     # Plot the histogram and the fitted distribution
@@ -127,8 +257,8 @@ def generate_violinplot(measurements: List[DiameterMeasurement], output_folder_p
     :param file_name: Name of original image file
     :param pixel_measurements: Whether you want your results to be measured in pixels (True) or microns (False)
     """
-    diameters = filter_diameter_measurements(measurements, MAX_DIAMETER, pixel_measurements)
-    plt.violinplot(diameters, showextrema=True, showmedians=True)
+    sketch = build_diameter_sketch(measurements, pixel_measurements)
+    plot_sketch_violins([sketch], [1])
 
     plt.title('Violin Plot of Vessel Diameters')
     plt.ylabel(f'Vessel diameter {"(pixels)" if pixel_measurements else "(microns)"}')
@@ -138,6 +268,27 @@ def generate_violinplot(measurements: List[DiameterMeasurement], output_folder_p
     save_figure(save_path)
 
 
+def generate_boxplot(measurements: List[DiameterMeasurement], output_folder_path: str,
+                     file_name: str, pixel_measurements: bool) -> None:
+    """
+    Generate a box plot of the measurements and save to a file.
+
+    :param measurements: The measurements
+    :param output_folder_path: Path to the output folder
+    :param file_name: Name of original image file
+    :param pixel_measurements: Whether you want your results to be measured in pixels (True) or microns (False)
+    """
+    sketch = build_diameter_sketch(measurements, pixel_measurements)
+    plot_sketch_boxplots([sketch], [1])
+
+    plt.title('Box Plot of Vessel Diameters')
+    plt.ylabel(f'Vessel diameter {"(pixels)" if pixel_measurements else "(microns)"}')
+    plt.xlabel('')
+
+    save_path = output_folder_path + f'/{file_name}-box.png'
+    save_figure(save_path)
+
+
 def generate_scatterplot(measurements: List[DiameterMeasurement], output_folder_path: str,
                          file_name: str, pixel_measurements: bool) -> None:
     """